@@ -6,9 +6,9 @@ Tools for converting Cran packages to conda recipes.
 
 
 import argparse
-import copy
-from itertools import chain
-from os import makedirs, listdir, sep, environ
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from functools import lru_cache
+from os import cpu_count, makedirs, listdir, sep, environ
 from os.path import (basename, commonprefix, exists, isabs, isdir,
                      isfile, join, normpath, realpath, relpath)
 import re
@@ -118,6 +118,8 @@ about:
 
 """
 
+# CRAN_BUILD_SH_SOURCE and CRAN_BLD_BAT_SOURCE are written verbatim; they are
+# not passed through str.format.
 CRAN_BUILD_SH_SOURCE = """\
 #!/bin/bash
 
@@ -134,7 +136,7 @@ export DISABLE_AUTOBREW=1
 mv DESCRIPTION DESCRIPTION.old
 grep -va '^Priority: ' DESCRIPTION.old > DESCRIPTION
 # shellcheck disable=SC2086
-${{R}} CMD INSTALL --build . ${{R_ARGS}}
+${R} CMD INSTALL --build . ${R_ARGS}
 
 # Add more build steps here, if they are necessary.
 
@@ -217,7 +219,7 @@ exit 0
 
 INDENT = '\n    - '
 
-CRAN_KEYS = [
+CRAN_KEYS = frozenset((
     'Site',
     'Archs',
     'Depends',
@@ -239,12 +241,12 @@ CRAN_KEYS = [
     'Title',
     'Author',
     'Maintainer',
-]
+))
 
 # The following base/recommended package names are derived from R's source
 # tree (R-3.0.2/share/make/vars.mk).  Hopefully they don't change too much
 # between versions.
-R_BASE_PACKAGE_NAMES = (
+R_BASE_PACKAGE_NAMES = frozenset((
     'base',
     'compiler',
     'datasets',
@@ -259,9 +261,9 @@ R_BASE_PACKAGE_NAMES = (
     'tcltk',
     'tools',
     'utils',
-)
+))
 
-R_RECOMMENDED_PACKAGE_NAMES = (
+R_RECOMMENDED_PACKAGE_NAMES = frozenset((
     'MASS',
     'lattice',
     'Matrix',
@@ -277,7 +279,7 @@ R_RECOMMENDED_PACKAGE_NAMES = (
     'nnet',
     'spatial',
     'mgcv',
-)
+))
 
 # Stolen then tweaked from debian.deb822.PkgRelation.__dep_RE.
 VERSION_DEPENDENCY_REGEX = re.compile(
@@ -287,6 +289,21 @@ VERSION_DEPENDENCY_REGEX = re.compile(
     r'?(\s*\[(?P<archs>[\s!\w\-]+)\])?\s*$'
 )
 
+# DESCRIPTION fields continue onto following lines indented with whitespace.
+_CONTINUATION_REGEX = re.compile(r'\n[ \t]+')
+
+# A non-empty, whitespace-trimmed entry of a comma-separated field.
+_FIELD_ENTRY_REGEX = re.compile(r'[^,\s](?:[^,]*[^,\s])?')
+
+# VERSION_DEPENDENCY_REGEX for one entry of a comma-separated field, so that a
+# whole field can be parsed with a single finditer. Empty entries are skipped.
+_DEP_ENTRY_REGEX = re.compile(
+    r'[\s,]*(?P<dep>(?P<name>[a-zA-Z0-9.+\-]{1,})'
+    r'(\s*\(\s*(?P<relop>[>=<]+)\s*'
+    r'(?P<version>[0-9a-zA-Z:\-+~.]+)\s*\))'
+    r'?(\s*\[(?P<archs>[\s!\w\-]+)\])?)\s*(?:,|$)'
+)
+
 target_platform_bash_test_by_sel = {'linux': '=~ linux.*',
                                     'linux32': '== linux-32',
                                     'linux64': '== linux-64',
@@ -456,80 +473,53 @@ def dict_from_cran_lines(lines):
     for line in lines:
         if not line:
             continue
-        try:
-            if ': ' in line:
-                (k, v) = line.split(': ', 1)
-            else:
-                # Sometimes fields are included but left blank, e.g.:
-                #   - Enhances in data.tree
-                #   - Suggests in corpcor
-                (k, v) = line.split(':', 1)
-        except ValueError:
-            sys.exit("Error: Could not parse metadata (%s)" % line)
-        d[k] = v
+        k, found, v = line.partition(': ')
+        if not found:
+            # Sometimes fields are included but left blank, e.g.:
+            #   - Enhances in data.tree
+            #   - Suggests in corpcor
+            k, found, v = line.partition(':')
+            if not found:
+                sys.exit("Error: Could not parse metadata (%s)" % line)
+        # Field names and short values (licenses, yes/no flags, OS types, ...)
+        # repeat across packages; share a single copy of each.
+        d[sys.intern(k)] = sys.intern(v) if len(v) < 64 else v
         # if k not in CRAN_KEYS:
         #     print("Warning: Unknown key %s" % k)
-    d['orig_lines'] = lines
+    # Only ever read back, so keep the compact immutable form.
+    d['orig_lines'] = tuple(lines)
     return d
 
 
-def remove_package_line_continuations(chunk):
-    """
-    >>> chunk = [
-        'Package: A3',
-        'Version: 0.9.2',
-        'Depends: R (>= 2.15.0), xtable, pbapply',
-        'Suggests: randomForest, e1071',
-        'Imports: MASS, R.methodsS3 (>= 1.5.2), R.oo (>= 1.15.8), R.utils (>=',
-        '        1.27.1), matrixStats (>= 0.8.12), R.filesets (>= 2.3.0), ',
-        '        sampleSelection, scatterplot3d, strucchange, systemfit',
-        'License: GPL (>= 2)',
-        'NeedsCompilation: no']
-    >>> remove_package_line_continuations(chunk)
-    ['Package: A3',
-     'Version: 0.9.2',
-     'Depends: R (>= 2.15.0), xtable, pbapply',
-     'Suggests: randomForest, e1071',
-     'Imports: MASS, R.methodsS3 (>= 1.5.2), R.oo (>= 1.15.8), R.utils (>= 1.27.1), matrixStats (>= 0.8.12), R.filesets (>= 2.3.0), sampleSelection, scatterplot3d, strucchange, systemfit, rgl,'
-     'License: GPL (>= 2)',
-     'NeedsCompilation: no']
-    """  # NOQA
-    continuation = (' ', '\t')
-    continued_ix = None
-    continued_line = None
-    had_continuation = False
-    accumulating_continuations = False
-
-    chunk.append('')
-
-    for (i, line) in enumerate(chunk):
-        if line.startswith(continuation):
-            line = ' ' + line.lstrip()
-            if accumulating_continuations:
-                assert had_continuation
-                continued_line += line
-                chunk[i] = None
-            else:
-                accumulating_continuations = True
-                continued_ix = i - 1
-                continued_line = chunk[continued_ix] + line
-                had_continuation = True
-                chunk[i] = None
-        else:
-            if accumulating_continuations:
-                assert had_continuation
-                chunk[continued_ix] = continued_line
-                accumulating_continuations = False
-                continued_line = None
-                continued_ix = None
+@lru_cache(maxsize=None)
+def _conda_name(name):
+    """Return the conda package name for the CRAN package `name`."""
+    return 'r-' + name.lower()
 
-    if had_continuation:
-        # Remove the None(s).
-        chunk = [c for c in chunk if c]
 
-    chunk.append('')
+def _split_field(value):
+    """Return the stripped, non-empty entries of a comma-separated field."""
+    return _FIELD_ENTRY_REGEX.findall(value)
 
-    return chunk
+
+def _iter_deps(value):
+    """
+    Yield a (dep, name, relop, version, archs) tuple for each entry of the
+    comma-separated dependency field `value`.
+
+    Raises ValueError with the first entry that cannot be parsed.
+    """
+    end = 0
+    for match in _DEP_ENTRY_REGEX.finditer(value):
+        if match.start() != end:
+            # Something unparseable was skipped over.
+            break
+        end = match.end()
+        yield (match.group('dep'), sys.intern(match.group('name')),
+               match.group('relop'), match.group('version'), match.group('archs'))
+    unparsed = _split_field(value[end:])
+    if unparsed:
+        raise ValueError(unparsed[0])
 
 
 def yaml_quote_string(string):
@@ -561,9 +551,8 @@ def clear_whitespace(string):
 def read_description_contents(fp):
     bytes = fp.read()
     text = bytes.decode('utf-8', errors='replace')
-    text = clear_whitespace(text)
-    lines = remove_package_line_continuations(text.splitlines())
-    return dict_from_cran_lines(lines)
+    text = _CONTINUATION_REGEX.sub(' ', clear_whitespace(text))
+    return dict_from_cran_lines(text.splitlines())
 
 
 def get_archive_metadata(path, verbose=True):
@@ -622,7 +611,7 @@ def _ssl_no_verify():
 
 def get_session(output_dir, verbose=True):
     session = requests.Session()
-    session.verify = _ssl_no_verify()
+    session.verify = not _ssl_no_verify()
     try:
         import cachecontrol
         import cachecontrol.caches
@@ -656,21 +645,39 @@ def get_cran_archive_versions(cran_url, session, package, verbose=True):
     return [v for dt, v in sorted(versions, reverse=True)]
 
 
+def _iter_listing_lines(response):
+    """Iterate over the decoded lines of a streamed CRAN directory listing."""
+    response.raise_for_status()
+    if response.encoding is None:
+        response.encoding = 'utf-8'
+    return response.iter_lines(decode_unicode=True)
+
+
 def get_cran_index(cran_url, session, verbose=True):
     if verbose:
         print("Fetching main index from %s" % cran_url)
-    r = session.get(cran_url + "/src/contrib/")
-    r.raise_for_status()
+    # The current and archived listings are independent, fetch them together.
+    # Both are streamed; each listing row is on a line of its own.
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        current = executor.submit(session.get, cran_url + "/src/contrib/", stream=True)
+        archived = executor.submit(session.get, cran_url + "/src/contrib/Archive/", stream=True)
     records = {}
-    for p in re.findall(r'<td><a href="([^"]+)">\1</a></td>', r.text):
-        if p.endswith('.tar.gz') and '_' in p:
-            name, version = p.rsplit('.', 2)[0].split('_', 1)
-            records[name.lower()] = (name, version)
-    r = session.get(cran_url + "/src/contrib/Archive/")
-    r.raise_for_status()
-    for p in re.findall(r'<td><a href="([^"]+)/">\1/</a></td>', r.text):
-        if re.match(r'^[A-Za-z]', p):
-            records.setdefault(p.lower(), (p, None))
+    try:
+        with current.result() as r:
+            for line in _iter_listing_lines(r):
+                for p in re.findall(r'<td><a href="([^"]+)">\1</a></td>', line):
+                    if p.endswith('.tar.gz') and '_' in p:
+                        name, version = p.rsplit('.', 2)[0].split('_', 1)
+                        records[name.lower()] = (name, version)
+        with archived.result() as r:
+            for line in _iter_listing_lines(r):
+                for p in re.findall(r'<td><a href="([^"]+)/">\1/</a></td>', line):
+                    if re.match(r'^[A-Za-z]', p):
+                        records.setdefault(p.lower(), (p, None))
+    finally:
+        # Release the archived listing's connection if the current one failed.
+        if archived.exception() is None:
+            archived.result().close()
     return records
 
 
@@ -791,9 +798,9 @@ def package_to_inputs_dict(output_dir, output_suffix, git_tag, package, version=
             'version': version}
 
 
-def get_available_binaries(cran_url, details):
+def get_available_binaries(cran_url, details, session):
     url = cran_url + '/' + details['dir']
-    response = requests.get(url)
+    response = session.get(url)
     response.raise_for_status()
     ext = details['ext']
     for filename in re.findall(r'<a href="([^"]*)">\1</a>', response.text):
@@ -803,6 +810,16 @@ def get_available_binaries(cran_url, details):
             details['binaries'].setdefault(pkg, []).append((ver, url + filename))
 
 
+def _get_available_binaries_concurrently(cran_url, layouts, session):
+    """Run get_available_binaries for each of `layouts` in parallel."""
+    with ThreadPoolExecutor(max_workers=len(layouts)) as executor:
+        futures = [executor.submit(get_available_binaries, cran_url, details, session)
+                   for details in layouts]
+        for future in as_completed(futures):
+            # Re-raise any HTTP errors from the listing fetch.
+            future.result()
+
+
 def remove_comments(template):
     re_comment = re.compile(r'^\s*#\s')
     lines = template.split('\n')
@@ -847,6 +864,7 @@ def skeletonize(in_packages, output_dir=".", output_suffix="", add_maintainer=No
 
     # Get cran index lazily so we don't have to go to CRAN
     # for a github repo or a local tarball
+    session = None
     cran_index = None
 
     cran_layout_template = \
@@ -867,10 +885,14 @@ def skeletonize(in_packages, output_dir=".", output_suffix="", add_maintainer=No
                               'use_this': True if use_binaries_ver else False}}
 
     # Figure out what binaries are available once:
+    binary_layouts = []
     for archive_type, archive_details in iteritems(cran_layout_template):
         archive_details['binaries'] = dict()
         if archive_type != 'source' and archive_details['use_this']:
-            get_available_binaries(cran_url, archive_details)
+            binary_layouts.append(archive_details)
+    if binary_layouts:
+        session = get_session(output_dir)
+        _get_available_binaries_concurrently(cran_url, binary_layouts, session)
 
     for package in in_packages:
         inputs_dict = package_to_inputs_dict(output_dir, output_suffix, git_tag, package, version)
@@ -880,6 +902,10 @@ def skeletonize(in_packages, output_dir=".", output_suffix="", add_maintainer=No
     for package_name, package_dict in package_dicts.items():
         package_list.append(package_name)
 
+    # Loop invariants for the per-package recipe generation below.
+    _all = ['linux', 'win32', 'win64', 'osx']
+    sel_cross = "  # [build_platform != target_platform]"
+
     while package_list:
         inputs = package_dicts[package_list.pop()]['inputs']
         location = inputs['location']
@@ -930,11 +956,13 @@ def skeletonize(in_packages, output_dir=".", output_suffix="", add_maintainer=No
 
         else:
             if cran_index is None:
-                session = get_session(output_dir)
+                if session is None:
+                    session = get_session(output_dir)
                 cran_index = get_cran_index(cran_url, session)
-            if pkg_name.lower() not in cran_index:
+            try:
+                package, cran_version = cran_index[pkg_name.lower()]
+            except KeyError:
                 sys.exit("Package %s not found" % pkg_name)
-            package, cran_version = cran_index[pkg_name.lower()]
             if cran_version and (not version or version == cran_version):
                 version = cran_version
             elif version and not archive:
@@ -959,12 +987,11 @@ def skeletonize(in_packages, output_dir=".", output_suffix="", add_maintainer=No
         if cran_package is not None:
             package = cran_package['Package']
             version = cran_package['Version']
-        plower = package.lower()
         d = package_dicts[pkg_name]
         d.update({
                 'cran_packagename': package,
                 'cran_version': version,
-                'packagename': 'r-' + plower,
+                'packagename': _conda_name(package),
                 # Conda versions cannot have -. Conda (verlib) will treat _ as a .
                 'conda_version': version.replace('-', '_'),
                 'patches': '',
@@ -1013,7 +1040,10 @@ def skeletonize(in_packages, output_dir=".", output_suffix="", add_maintainer=No
         d['build_number'] = build_number
 
         cached_path = None
-        cran_layout = copy.deepcopy(cran_layout_template)
+        # The binaries listings cover every package on CRAN and are only read
+        # below, so share them instead of deep-copying them for each package.
+        cran_layout = {archive_type: dict(archive_details)
+                       for archive_type, archive_details in iteritems(cran_layout_template)}
         available = {}
 
         description_path = None
@@ -1058,8 +1088,8 @@ def skeletonize(in_packages, output_dir=".", output_suffix="", add_maintainer=No
                     filename_rendered = '{}_{}{}'.format(
                         package, archive_details['cran_version'], archive_details['ext'])
                     filename = f'{package}_{{{{ version }}}}' + archive_details['ext']
-                    contrib_url = '{{{{ cran_mirror }}}}/{}'.format(archive_details['dir'])
-                    contrib_url_rendered = cran_url + '/{}'.format(archive_details['dir'])
+                    contrib_url = f"{{{{ cran_mirror }}}}/{archive_details['dir']}"
+                    contrib_url_rendered = f"{cran_url}/{archive_details['dir']}"
                     package_url = contrib_url_rendered + filename_rendered
                     print(f"Downloading {archive_type} from {package_url}")
                     try:
@@ -1112,7 +1142,6 @@ def skeletonize(in_packages, output_dir=".", output_suffix="", add_maintainer=No
                 available[archive_type] = available_details
 
         # Figure out the selectors according to what is available.
-        _all = ['linux', 'win32', 'win64', 'osx']
         from_source = _all[:]
         binary_id = 1
         for archive_type, archive_details in iteritems(available):
@@ -1134,7 +1163,6 @@ def skeletonize(in_packages, output_dir=".", output_suffix="", add_maintainer=No
                                                     fs.startswith('win')) + ']'
             sel_src_not_win = '  # [' + ' or '.join(fs for fs in from_source if not
                                                     fs.startswith('win')) + ']'
-        sel_cross = "  # [build_platform != target_platform]"
         d['sel_src'] = sel_src
         d['sel_src_and_win'] = sel_src_and_win
         d['sel_src_not_win'] = sel_src_not_win
@@ -1164,8 +1192,8 @@ def skeletonize(in_packages, output_dir=".", output_suffix="", add_maintainer=No
         # Extract the DESCRIPTION data from the source
         if cran_package is None:
             cran_package = get_archive_metadata(description_path)
-        d['cran_metadata'] = '\n'.join(['# %s' % line for line in
-            cran_package['orig_lines'] if line])
+        d['cran_metadata'] = '\n'.join(f'# {line}' for line in
+            cran_package['orig_lines'] if line)
 
         # Render the source and binaryN keys
         binary_id = 1
@@ -1215,28 +1243,22 @@ def skeletonize(in_packages, output_dir=".", output_suffix="", add_maintainer=No
 
         # Every package depends on at least R.
         # I'm not sure what the difference between depends and imports is.
-        depends = [s.strip() for s in cran_package.get('Depends',
-            '').split(',') if s.strip()]
-        imports = [s.strip() for s in cran_package.get('Imports',
-            '').split(',') if s.strip()]
-        links = [s.strip() for s in cran_package.get("LinkingTo",
-            '').split(',') if s.strip()]
+        dep_fields = ','.join(cran_package.get(field, '')
+                              for field in ('Imports', 'Depends', 'LinkingTo'))
+        try:
+            parsed_deps = list(_iter_deps(dep_fields))
+        except ValueError as e:
+            sys.exit("Could not parse version from dependency of %s: %s" %
+                (package, e))
 
+        # Keyed by name in order of first appearance; later specs of the same
+        # name are ignored.
         dep_dict = {}
-
-        seen = set()
-        for s in list(chain(imports, depends, links)):
-            match = VERSION_DEPENDENCY_REGEX.match(s)
-            if not match:
-                sys.exit("Could not parse version from dependency of %s: %s" %
-                    (package, s))
-            name = match.group('name')
-            if name in seen:
+        for s, name, relop, ver, archs in parsed_deps:
+            if name in dep_dict:
                 continue
-            seen.add(name)
-            archs = match.group('archs')
-            relop = match.group('relop') or ''
-            ver = match.group('version') or ''
+            relop = relop or ''
+            ver = ver or ''
             ver = ver.replace('-', '_')
             # If there is a relop there should be a version
             assert not relop or ver
@@ -1287,10 +1309,44 @@ def skeletonize(in_packages, output_dir=".", output_suffix="", add_maintainer=No
         if need_cxx:
             need_c = True
 
+        # The R package requirements are the same for host and run, so render
+        # them (and queue them up when recursing) only once.
+        r_package_deps = []
+        for name in sorted(dep_dict.keys() - R_BASE_PACKAGE_NAMES - {'R'}):
+            conda_name = _conda_name(name)
+
+            if dep_dict[name]:
+                r_package_deps.append(f'{INDENT}{conda_name} {dep_dict[name]}')
+            else:
+                r_package_deps.append(f'{INDENT}{conda_name}')
+            if recursive:
+                lower_name = name.lower()
+                if lower_name not in package_dicts:
+                    inputs_dict = package_to_inputs_dict(output_dir, output_suffix,
+                                                         git_tag, lower_name, None)
+                    assert lower_name == inputs_dict['pkg-name'], \
+                        "name {} != inputs_dict['pkg-name'] {}".format(
+                            name, inputs_dict['pkg-name'])
+                    assert lower_name not in package_list
+                    package_dicts.update({lower_name: {'inputs': inputs_dict}})
+                    package_list.append(lower_name)
+        r_package_depends = ''.join(r_package_deps)
+
         for dep_type in ['build', 'host', 'run']:
 
             deps = []
-            # Put non-R dependencies first.
+            if dep_type == 'host' or dep_type == 'run':
+                # Put R first (dep_dict always contains it).
+                # Regarless of build or run, and whether this is a
+                # recommended package or not, it can only depend on
+                # r_interp since anything else can and will cause
+                # cycles in the dependency graph. The cran metadata
+                # lists all dependencies anyway, even those packages
+                # that are in the recommended group.
+                # We don't include any R version restrictions because
+                # conda-build always pins r-base and mro-base version.
+                deps.append(f'{INDENT}{r_interp}')
+            # Put non-R dependencies before the R packages.
             if dep_type == 'build':
                 if need_c:
                     deps.append("{indent}{{{{ compiler('c') }}}}            {sel}".format(
@@ -1351,40 +1407,7 @@ def skeletonize(in_packages, output_dir=".", output_suffix="", add_maintainer=No
                         indent=INDENT, sel=sel_src_and_win))
 
             if dep_type == 'host' or dep_type == 'run':
-                for name in sorted(dep_dict):
-                    if name in R_BASE_PACKAGE_NAMES:
-                        continue
-                    if name == 'R':
-                        # Put R first
-                        # Regarless of build or run, and whether this is a
-                        # recommended package or not, it can only depend on
-                        # r_interp since anything else can and will cause
-                        # cycles in the dependency graph. The cran metadata
-                        # lists all dependencies anyway, even those packages
-                        # that are in the recommended group.
-                        # We don't include any R version restrictions because
-                        # conda-build always pins r-base and mro-base version.
-                        deps.insert(0, f'{INDENT}{r_interp}')
-                    else:
-                        conda_name = 'r-' + name.lower()
-
-                        if dep_dict[name]:
-                            deps.append('{indent}{name} {version}'.format(name=conda_name,
-                                version=dep_dict[name], indent=INDENT))
-                        else:
-                            deps.append('{indent}{name}'.format(name=conda_name,
-                                indent=INDENT))
-                        if recursive:
-                            lower_name = name.lower()
-                            if lower_name not in package_dicts:
-                                inputs_dict = package_to_inputs_dict(output_dir, output_suffix,
-                                                                     git_tag, lower_name, None)
-                                assert lower_name == inputs_dict['pkg-name'], \
-                                    "name {} != inputs_dict['pkg-name'] {}".format(
-                                        name, inputs_dict['pkg-name'])
-                                assert lower_name not in package_list
-                                package_dicts.update({lower_name: {'inputs': inputs_dict}})
-                                package_list.append(lower_name)
+                deps.append(r_package_depends)
 
             d['%s_depends' % dep_type] = ''.join(deps)
 
@@ -1393,6 +1416,7 @@ def skeletonize(in_packages, output_dir=".", output_suffix="", add_maintainer=No
         CRAN_BUILD_SH_SOURCE = remove_comments(CRAN_BUILD_SH_SOURCE)
         CRAN_META = remove_comments(CRAN_META)
 
+    recipes = []
     for package in package_dicts:
         d = package_dicts[package]
         dir_path = d['inputs']['new-location']
@@ -1404,7 +1428,8 @@ def skeletonize(in_packages, output_dir=".", output_suffix="", add_maintainer=No
                 rm_rf(dir_path)
         elif update_policy == 'skip-up-to-date':
             if cran_index is None:
-                session = get_session(output_dir)
+                if session is None:
+                    session = get_session(output_dir)
                 cran_index = get_cran_index(cran_url, session)
             if up_to_date(cran_index, d['inputs']['old-metadata']):
                 continue
@@ -1415,31 +1440,68 @@ def skeletonize(in_packages, output_dir=".", output_suffix="", add_maintainer=No
         # Normalize the metadata values
         d = {k: unicodedata.normalize("NFKD", text_type(v)).encode('ascii', 'ignore')
              .decode() for k, v in iteritems(d)}
-        try:
-            makedirs(join(dir_path))
-        except:
-            pass
-        print("Writing recipe for %s" % package.lower())
-        with open(join(dir_path, 'meta.yaml'), 'w') as f:
-            f.write(clear_whitespace(CRAN_META.format(**d)))
+        meta_yaml = clear_whitespace(CRAN_META.format_map(d))
+        build_sh = bld_bat = None
         if not exists(join(dir_path, 'build.sh')) or update_policy == 'overwrite':
-            with open(join(dir_path, 'build.sh'), 'wb') as f:
-                if from_sources == _all:
-                    f.write(CRAN_BUILD_SH_SOURCE.format(**d).encode('utf-8'))
-                elif from_sources == []:
-                    f.write(CRAN_BUILD_SH_BINARY.format(**d).encode('utf-8'))
-                else:
-                    tpbt = [target_platform_bash_test_by_sel[t] for t in from_sources]
-                    d['source_pf_bash'] = ' || '.join(['[[ ${target_platform} ' + s + ' ]]'
-                                                  for s in tpbt])
-                    f.write(CRAN_BUILD_SH_MIXED.format(**d).encode('utf-8'))
+            if from_sources == _all:
+                build_sh = CRAN_BUILD_SH_SOURCE.encode('utf-8')
+            elif from_sources == []:
+                build_sh = CRAN_BUILD_SH_BINARY.format_map(d).encode('utf-8')
+            else:
+                tpbt = [target_platform_bash_test_by_sel[t] for t in from_sources]
+                d['source_pf_bash'] = ' || '.join(['[[ ${target_platform} ' + s + ' ]]'
+                                              for s in tpbt])
+                build_sh = CRAN_BUILD_SH_MIXED.format_map(d).encode('utf-8')
 
         if not exists(join(dir_path, 'bld.bat')) or update_policy == 'overwrite':
-            with open(join(dir_path, 'bld.bat'), 'wb') as f:
-                if len([fs for fs in from_sources if fs.startswith('win')]) == 2:
-                    f.write(CRAN_BLD_BAT_SOURCE.format(**d).replace('\n', '\r\n').encode('utf-8'))
-                else:
-                    f.write(CRAN_BLD_BAT_MIXED.format(**d).replace('\n', '\r\n').encode('utf-8'))
+            if len([fs for fs in from_sources if fs.startswith('win')]) == 2:
+                bld_bat = CRAN_BLD_BAT_SOURCE.replace('\n', '\r\n').encode('utf-8')
+            else:
+                bld_bat = CRAN_BLD_BAT_MIXED.format_map(d).replace('\n', '\r\n').encode('utf-8')
+        recipes.append((package.lower(), dir_path, meta_yaml, build_sh, bld_bat))
+
+    _write_recipes(recipes)
+
+
+def _write_recipes(recipes):
+    """
+    Write (package, dir_path, meta_yaml, build_sh, bld_bat) recipes using a
+    thread pool, since writing them is I/O bound.
+
+    Every recipe is attempted. A single failure is re-raised as is; several
+    are reported together in a RuntimeError chained to the first of them.
+    """
+    failures = []
+    with ThreadPoolExecutor(max_workers=(cpu_count() or 1) * 4) as executor:
+        futures = {executor.submit(_write_recipe, *recipe): recipe[0] for recipe in recipes}
+        for future in as_completed(futures):
+            try:
+                future.result()
+            except OSError as e:
+                failures.append((futures[future], e))
+    if len(failures) == 1:
+        raise failures[0][1]
+    if failures:
+        failures.sort(key=lambda failure: failure[0])
+        raise RuntimeError("Failed to write recipes:\n  " + "\n  ".join(
+            f"{package}: {e}" for package, e in failures)) from failures[0][1]
+
+
+def _write_recipe(package, dir_path, meta_yaml, build_sh, bld_bat):
+    """
+    Write the recipe for `package` to `dir_path`. `build_sh` and `bld_bat` are
+    the encoded script contents, or None to leave any existing script untouched.
+    """
+    print("Writing recipe for %s" % package)
+    makedirs(dir_path, exist_ok=True)
+    with open(join(dir_path, 'meta.yaml'), 'w') as f:
+        f.write(meta_yaml)
+    if build_sh is not None:
+        with open(join(dir_path, 'build.sh'), 'wb') as f:
+            f.write(build_sh)
+    if bld_bat is not None:
+        with open(join(dir_path, 'bld.bat'), 'wb') as f:
+            f.write(bld_bat)
 
 
 def version_compare(recipe_dir, newest_conda_version):
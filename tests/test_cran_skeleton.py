@@ -6,10 +6,21 @@ Unit tests of the CRAN skeleton utility functions
 
 
 import os
+import re
 import pytest
+import requests
 
 from conda_build.license_family import allowed_license_families
-from conda_build.skeletons.cran import (get_license_info,
+from conda_build.skeletons.cran import (CRAN_BLD_BAT_SOURCE,
+                                        CRAN_BUILD_SH_SOURCE,
+                                        VERSION_DEPENDENCY_REGEX,
+                                        _get_available_binaries_concurrently,
+                                        _iter_deps,
+                                        _split_field,
+                                        _write_recipes,
+                                        get_cran_index,
+                                        get_license_info,
+                                        get_session,
                                         read_description_contents,
                                         remove_comments)
 
@@ -71,3 +82,150 @@ keep # keep
 '''
     observed = remove_comments(example)
     assert observed == expected
+
+
+def test_verbatim_templates_are_not_escaped():
+    # These templates are written out as-is, without str.format.
+    assert '{' not in CRAN_BLD_BAT_SOURCE
+    assert '{{' not in CRAN_BUILD_SH_SOURCE
+    assert '${R} CMD INSTALL --build . ${R_ARGS}' in CRAN_BUILD_SH_SOURCE
+
+
+@pytest.mark.parametrize("dep", ['R', 'R (>= 2.15.0)', 'R.utils(>=1.27.1)', 'x ( >= 1.0-2 )',
+                                 'x [linux]', 'x (>= 1) [!win]', ' Rcpp ', 'x (1.0)', 'x (>=)',
+                                 'x (>= 1', 'x [', 'x y', '(>= 1)', ''])
+def test_iter_deps_matches_regex(dep):
+    field = f' Rcpp (>= 1.0),, {dep} , utils'
+    expected = []
+    for entry in field.split(','):
+        entry = entry.strip()
+        if entry:
+            match = VERSION_DEPENDENCY_REGEX.match(entry)
+            if not match:
+                with pytest.raises(ValueError, match=re.escape(entry)):
+                    list(_iter_deps(field))
+                return
+            expected.append((entry,) + match.group('name', 'relop', 'version', 'archs'))
+    assert list(_iter_deps(field)) == expected
+
+
+@pytest.mark.parametrize("value", ['', ' ', ',', 'a', ' a , b,,c ', 'R (>= 3.0), Rcpp\t,\n x',
+                                   'a b, ,', ' ,a'])
+def test_split_field(value):
+    assert _split_field(value) == [s.strip() for s in value.split(',') if s.strip()]
+
+
+def test_write_recipes(tmp_path):
+    blocker = tmp_path / 'not-a-dir'
+    blocker.write_text('')
+    good = tmp_path / 'r-good'
+    recipes = [('good', str(good), 'meta', b'sh', None),
+               ('bad', str(blocker / 'r-bad'), 'meta', b'sh', b'bat')]
+    with pytest.raises(OSError):
+        _write_recipes(recipes)
+    # The failure does not stop the other recipes from being written.
+    assert (good / 'meta.yaml').read_text() == 'meta'
+    assert (good / 'build.sh').read_bytes() == b'sh'
+    assert not (good / 'bld.bat').exists()
+
+
+def test_write_recipes_reports_all_failures(tmp_path):
+    blocker = tmp_path / 'not-a-dir'
+    blocker.write_text('')
+    recipes = [(name, str(blocker / name), 'meta', None, None) for name in ('r-b', 'r-a')]
+    with pytest.raises(RuntimeError, match='r-a: .*\n  r-b: ') as excinfo:
+        _write_recipes(recipes)
+    assert isinstance(excinfo.value.__cause__, OSError)
+
+
+@pytest.mark.parametrize("ssl_no_verify, verify", [(None, True), ('0', True),
+                                                   ('1', False), ('True', False)])
+def test_get_session_verify(monkeypatch, tmp_path, ssl_no_verify, verify):
+    if ssl_no_verify is None:
+        monkeypatch.delenv('SSL_NO_VERIFY', raising=False)
+    else:
+        monkeypatch.setenv('SSL_NO_VERIFY', ssl_no_verify)
+    assert get_session(str(tmp_path), verbose=False).verify is verify
+
+
+class FakeResponse:
+    def __init__(self, text, status_code=200):
+        self.text = text
+        self.status_code = status_code
+        self.encoding = None
+        self.closed = False
+
+    def raise_for_status(self):
+        if self.status_code != 200:
+            raise requests.exceptions.HTTPError(f"{self.status_code} Error")
+
+    def iter_lines(self, decode_unicode=False):
+        assert decode_unicode and self.encoding
+        return iter(self.text.splitlines())
+
+    def close(self):
+        self.closed = True
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+
+class FakeSession:
+    def __init__(self, responses):
+        self.responses = responses
+        self.requests = []
+
+    def get(self, url, **kwargs):
+        self.requests.append((url, kwargs))
+        return self.responses[url]
+
+
+CRAN = 'https://cran.example.org'
+
+
+def test_get_available_binaries_concurrently():
+    session = FakeSession({
+        f'{CRAN}/bin/windows/contrib/4.0/': FakeResponse(
+            '<a href="A3_1.0.0.zip">A3_1.0.0.zip</a>\n<a href="PACKAGES">PACKAGES</a>'),
+        f'{CRAN}/bin/macosx/contrib/4.0/': FakeResponse(
+            '<a href="A3_1.0.0.tgz">A3_1.0.0.tgz</a>'),
+    })
+    layouts = [{'dir': 'bin/windows/contrib/4.0/', 'ext': '.zip', 'binaries': {}},
+               {'dir': 'bin/macosx/contrib/4.0/', 'ext': '.tgz', 'binaries': {}}]
+    _get_available_binaries_concurrently(CRAN, layouts, session)
+    assert layouts[0]['binaries'] == {
+        'A3': [('1.0.0', f'{CRAN}/bin/windows/contrib/4.0/A3_1.0.0.zip')]}
+    assert layouts[1]['binaries'] == {
+        'A3': [('1.0.0', f'{CRAN}/bin/macosx/contrib/4.0/A3_1.0.0.tgz')]}
+
+
+def test_get_available_binaries_concurrently_raises():
+    session = FakeSession({f'{CRAN}/bin/windows/contrib/4.0/': FakeResponse('', 404)})
+    layouts = [{'dir': 'bin/windows/contrib/4.0/', 'ext': '.zip', 'binaries': {}}]
+    with pytest.raises(requests.exceptions.HTTPError):
+        _get_available_binaries_concurrently(CRAN, layouts, session)
+
+
+def test_get_cran_index():
+    current = FakeResponse('<tr><td><a href="A3_1.0.0.tar.gz">A3_1.0.0.tar.gz</a></td></tr>\n'
+                           '<tr><td><a href="PACKAGES">PACKAGES</a></td></tr>')
+    archived = FakeResponse('<tr><td><a href="A3/">A3/</a></td></tr>\n'
+                            '<tr><td><a href="oldpkg/">oldpkg/</a></td></tr>')
+    session = FakeSession({f'{CRAN}/src/contrib/': current,
+                           f'{CRAN}/src/contrib/Archive/': archived})
+    records = get_cran_index(CRAN, session, verbose=False)
+    assert records == {'a3': ('A3', '1.0.0'), 'oldpkg': ('oldpkg', None)}
+    assert all(kwargs == {'stream': True} for _, kwargs in session.requests)
+    assert current.closed and archived.closed
+
+
+def test_get_cran_index_closes_responses_on_error():
+    archived = FakeResponse('<tr><td><a href="A3/">A3/</a></td></tr>')
+    session = FakeSession({f'{CRAN}/src/contrib/': FakeResponse('', 500),
+                           f'{CRAN}/src/contrib/Archive/': archived})
+    with pytest.raises(requests.exceptions.HTTPError):
+        get_cran_index(CRAN, session, verbose=False)
+    assert archived.closed